@@ -11,12 +11,19 @@ This script creates/updates:
 from __future__ import annotations
 
 import argparse
+import functools
+import json
 import os
 import re
 import sys
+import tempfile
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
+from operator import itemgetter
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Iterator
 
 DEFAULT_EXTENSIONS = {
     ".js",
@@ -51,6 +58,13 @@ REQUIRED_HEADER_TAGS = ("@input", "@output", "@position")
 SYNC_TAGS = ("@doc-sync", "@auto-doc")
 DEFAULT_INDEX_FILE = "INDEX.md"
 DEFAULT_ARCHITECTURE_FILE = "ARCHITECTURE.md"
+DEFAULT_CACHE_FILE = ".format-doc-cache.json"
+CACHE_VERSION = 1
+HEADER_PEEK_BYTES = 8192
+LANGUAGE_PEEK_BYTES = 4096
+INFERENCE_MAX_CHARS = 65536
+PARALLEL_MIN_FILES = 256
+INDEX_ROW_TEMPLATE = "| {name} | {role} | {resp} |"
 
 ROLE_KEYWORDS = [
     ("controller", "Controller"),
@@ -72,6 +86,70 @@ ROLE_KEYWORDS = [
     ("component", "UI"),
 ]
 
+JS_EXTENSIONS = frozenset({".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx"})
+
+PY_HEADER_TEMPLATE = (
+    "\"\"\"\n"
+    "@input {inputs}\n"
+    "@output {outputs}\n"
+    "@position {position}\n"
+    "@doc-sync {sync}\n"
+    "\"\"\""
+)
+GO_HEADER_TEMPLATE = (
+    "// @input {inputs}\n"
+    "// @output {outputs}\n"
+    "// @position {position}\n"
+    "// @doc-sync {sync}"
+)
+JS_HEADER_TEMPLATE = (
+    "/**\n"
+    " * @input {inputs}\n"
+    " * @output {outputs}\n"
+    " * @position {position}\n"
+    " * @doc-sync {sync}\n"
+    " */"
+)
+# Extensions not listed here (JS/TS, Java, and any --ext additions) use the block comment.
+HEADER_TEMPLATES = {".py": PY_HEADER_TEMPLATE, ".go": GO_HEADER_TEMPLATE}
+
+_HEADER_TAG_RE = re.compile(rb"@(?:input|output|position|doc-sync|auto-doc)", re.IGNORECASE)
+# Every boundary str.splitlines() honors once decode_source() has folded \r\n and \r,
+# spelled as UTF-8 bytes.
+_LINE_BREAK_RE = re.compile(rb"\r\n?|[\n\x0b\x0c\x1c-\x1e]|\xc2\x85|\xe2\x80[\xa8\xa9]")
+# UTF-8 encodings of U+4E00..U+9FFF, so candidates can be scanned without decoding.
+_CJK_RE = re.compile(rb"\xe4[\xb8-\xbf][\x80-\xbf]|[\xe5-\xe9][\x80-\xbf]{2}")
+_PY_CODING_RE = re.compile(r"#.*coding[:=]\s*[-\w.]+")
+
+# The import/export patterns are matched against "\n" + content. A leading literal
+# "\n" in place of a MULTILINE "^" lets re use its fast prefix search instead of
+# testing every offset. "^\s*" becomes "[^\S\n]*": only the whitespace on the
+# keyword's own line decides a match, and no pattern can end on a newline, so
+# findall returns exactly what the "^" forms did.
+_TS_IMPORT_RE = re.compile(r"\n[^\S\n]*import\s+.*?\s+from\s+['\"]([^'\"]+)['\"]")
+_TS_REQUIRE_RE = re.compile(r"require\(\s*['\"]([^'\"]+)['\"]\s*\)")
+_TS_EXPORT_RE = re.compile(
+    r"\n[^\S\n]*export\s+(?:async\s+)?(?:function|class|const|let|var|interface|type|enum)\s+([A-Za-z_][A-Za-z0-9_]*)"
+)
+_TS_EXPORT_DEFAULT_RE = re.compile(r"\n[^\S\n]*export\s+default\b")
+_TS_EXPORT_BRACE_RE = re.compile(r"\n[^\S\n]*export\s*\{([^}]*)\}")
+
+_PY_FROM_RE = re.compile(r"from\s+([A-Za-z0-9_.]+)\s+import\s+")
+_PY_ALL_RE = re.compile(r"__all__\s*=\s*\[(.*?)\]", re.DOTALL)
+_PY_ALL_ITEM_RE = re.compile(r"['\"]([A-Za-z0-9_]+)['\"]")
+_PY_DEF_RE = re.compile(r"\ndef\s+([A-Za-z_][A-Za-z0-9_]*)\s*\(")
+_PY_CLASS_RE = re.compile(r"\nclass\s+([A-Za-z_][A-Za-z0-9_]*)\b")
+
+_GO_IMPORT_PATH_RE = re.compile(r"\"([^\"]+)\"")
+_GO_DECL_RE = re.compile(r"\n[^\S\n]*(?:type|var|const)\s+([A-Z][A-Za-z0-9_]*)\b")
+_GO_FUNC_RE = re.compile(r"\n[^\S\n]*func\s+([A-Z][A-Za-z0-9_]*)\s*\(")
+_GO_METHOD_RE = re.compile(r"\n[^\S\n]*func\s+\([^)]*\)\s+([A-Z][A-Za-z0-9_]*)\s*\(")
+
+_JAVA_IMPORT_RE = re.compile(r"\n[^\S\n]*import\s+([A-Za-z0-9_.*]+)\s*;")
+_JAVA_EXPORT_RE = re.compile(
+    r"\n[^\S\n]*public\s+(?:final\s+|abstract\s+)?(?:class|interface|enum|record)\s+([A-Za-z_][A-Za-z0-9_]*)\b"
+)
+
 
 @dataclass
 class Stats:
@@ -84,6 +162,7 @@ class Stats:
     architecture_updated: int = 0
     skipped_existing_index: int = 0
     skipped_existing_architecture: int = 0
+    skipped_cached_headers: int = 0
 
 
 def parse_args() -> argparse.Namespace:
@@ -154,6 +233,20 @@ def parse_args() -> argparse.Namespace:
         action="store_true",
         help="Skip ARCHITECTURE.md bootstrap",
     )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help=(
+            "Worker processes for file header bootstrap, used only when at least "
+            f"{PARALLEL_MIN_FILES} files need checking; 1 disables parallelism (default: CPU count)"
+        ),
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help=f"Skip files recorded as fully headed in {DEFAULT_CACHE_FILE} when mtime and size are unchanged",
+    )
     parser.add_argument(
         "--dry-run",
         action="store_true",
@@ -179,25 +272,72 @@ def normalize_extensions(extra_ext: Iterable[str]) -> set[str]:
     return extensions
 
 
-def contains_cjk(text: str) -> bool:
-    return re.search(r"[\u4e00-\u9fff]", text) is not None
+def decode_source(data: bytes) -> str:
+    # Same result as read_text(encoding="utf-8", errors="ignore"), including its
+    # universal-newline translation.
+    text = data.decode("utf-8", errors="ignore")
+    return text.replace("\r\n", "\n").replace("\r", "\n")
+
+
+def relative_posix(path: Path, root: Path) -> str:
+    # Every path handled here was collected beneath root, so plain prefix removal
+    # stands in for Path.relative_to and its per-part walk.
+    path_posix = path.as_posix()
+    root_posix = root.as_posix()
+    if path_posix == root_posix:
+        return "."
+    return path_posix.removeprefix(root_posix.rstrip("/") + "/")
+
 
+def _peek_head(path: Path, max_bytes: int = HEADER_PEEK_BYTES) -> bytes:
+    # O_BINARY keeps Windows from translating CRLF and stopping at 0x1A.
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    try:
+        data = os.read(fd, max_bytes)
+    finally:
+        os.close(fd)
+    return data
 
-def detect_language(root: Path, architecture_file: str, index_file: str) -> str:
+
+def contains_cjk(data: bytes) -> bool:
+    return _CJK_RE.search(data) is not None
+
+
+def _iter_named_files(root: Path, name: str, ignored_dirs: set[str], limit: int) -> Iterator[Path]:
+    if limit <= 0:
+        return
+    found = 0
+    is_ignored = frozenset(ignored_dirs).__contains__
+    pending = deque([str(root)])
+    while pending:
+        current_dir = pending.popleft()
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        if entry.is_symlink():
+                            continue
+                        if entry.name[:1] != "." and not is_ignored(entry.name):
+                            pending.append(entry.path)
+                    elif entry.name == name:
+                        yield Path(entry.path)
+                        found += 1
+                        if found >= limit:
+                            return
+        except OSError:
+            continue
+
+
+def detect_language(root: Path, architecture_file: str, index_file: str, ignored_dirs: set[str]) -> str:
     candidates = [root / architecture_file]
-    for path in root.rglob(index_file):
-        candidates.append(path)
-        if len(candidates) >= 20:
-            break
+    candidates.extend(_iter_named_files(root, index_file, ignored_dirs, 19))
 
     for path in candidates:
-        if not path.exists() or not path.is_file():
-            continue
         try:
-            text = path.read_text(encoding="utf-8", errors="ignore")
+            data = _peek_head(path, LANGUAGE_PEEK_BYTES)
         except OSError:
             continue
-        if contains_cjk(text):
+        if contains_cjk(data):
             return "zh"
     return "zh"
 
@@ -206,42 +346,106 @@ def collect_source_files(
     root: Path,
     extensions: set[str],
     ignored_dirs: set[str],
+    file_stats: dict[str, list[int]] | None = None,
 ) -> list[Path]:
-    source_files: list[Path] = []
-    for current_dir, dirnames, filenames in os.walk(root):
-        dirnames[:] = [
-            name for name in dirnames if name not in ignored_dirs and not name.startswith(".")
-        ]
-        base = Path(current_dir)
-        for filename in filenames:
-            path = base / filename
-            if path.suffix.lower() in extensions:
-                source_files.append(path.resolve())
-    return sorted(source_files)
+    source_files: list[str] = []
+    is_ignored = frozenset(ignored_dirs).__contains__
+    # Resolve the root once; scandir then yields absolute entry paths beneath it.
+    pending = [str(root.resolve())]
+    while pending:
+        current_dir = pending.pop()
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    name = entry.name
+                    if entry.is_dir():
+                        if entry.is_symlink():
+                            continue
+                        if name[:1] != "." and not is_ignored(name):
+                            pending.append(entry.path)
+                        continue
+                    # Same rule as Path.suffix, without building a Path per entry.
+                    dot = name.rfind(".")
+                    if 0 < dot < len(name) - 1 and name[dot:].lower() in extensions:
+                        source_files.append(entry.path)
+                        if file_stats is not None:
+                            try:
+                                info = entry.stat()
+                            except OSError:
+                                continue
+                            file_stats[entry.path] = [info.st_mtime_ns, info.st_size]
+        except OSError:
+            continue
+    source_files.sort(key=str.lower)
+    return [Path(path) for path in source_files]
+
+
+def load_header_cache(cache_path: Path, max_header_lines: int) -> dict[str, list[int]]:
+    try:
+        data = json.loads(cache_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    if data.get("version") != CACHE_VERSION or data.get("max_header_lines") != max_header_lines:
+        return {}
+    files = data.get("files")
+    return files if isinstance(files, dict) else {}
+
+
+def save_header_cache(cache_path: Path, cache: dict[str, list[int]], max_header_lines: int) -> None:
+    payload = json.dumps(
+        {"version": CACHE_VERSION, "max_header_lines": max_header_lines, "files": cache},
+        sort_keys=True,
+    )
+    fd, tmp_name = tempfile.mkstemp(dir=cache_path.parent, prefix=f"{cache_path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(payload)
+        # mkstemp creates the file 0600; give the cache the umask-derived mode that
+        # every other file this tool writes gets.
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_name, 0o666 & ~umask)
+        os.replace(tmp_name, cache_path)
+    except OSError:
+        os.unlink(tmp_name)
+        raise
 
 
 def group_files_by_folder(source_files: list[Path]) -> dict[Path, list[Path]]:
-    mapping: dict[Path, list[Path]] = {}
+    grouped: defaultdict[str, list[tuple[str, Path]]] = defaultdict(list)
     for path in source_files:
-        mapping.setdefault(path.parent, []).append(path)
-    for files in mapping.values():
-        files.sort(key=lambda x: x.name.lower())
+        folder, name = os.path.split(str(path))
+        grouped[folder].append((name.lower(), path))
+
+    mapping: dict[Path, list[Path]] = {}
+    for folder, entries in grouped.items():
+        entries.sort(key=itemgetter(0))
+        mapping[Path(folder)] = [path for _, path in entries]
     return mapping
 
 
-def has_complete_header(content: str, max_header_lines: int) -> bool:
-    snippet = "\n".join(content.splitlines()[:max_header_lines]).lower()
-    if not all(tag in snippet for tag in REQUIRED_HEADER_TAGS):
+def has_complete_header(data: bytes, max_header_lines: int) -> bool:
+    end = 0
+    if max_header_lines > 0:
+        end = len(data)
+        for count, line_break in enumerate(_LINE_BREAK_RE.finditer(data), 1):
+            if count == max_header_lines:
+                end = line_break.start()
+                break
+    found = {tag.decode("ascii").lower() for tag in _HEADER_TAG_RE.findall(data, 0, end)}
+    if not found.issuperset(REQUIRED_HEADER_TAGS):
         return False
-    if not any(tag in snippet for tag in SYNC_TAGS):
+    if found.isdisjoint(SYNC_TAGS):
         return False
     return True
 
 
-def infer_role(path: Path) -> str:
-    lowered = path.stem.lower()
+@functools.lru_cache(maxsize=None)
+def infer_role(stem_lower: str) -> str:
     for keyword, role in ROLE_KEYWORDS:
-        if keyword in lowered:
+        if keyword in stem_lower:
             return role
     return "Module"
 
@@ -269,97 +473,101 @@ def summarize_items(items: list[str], lang: str, max_items: int = 5) -> str:
     return ", ".join(unique)
 
 
-def infer_inputs(path: Path, content: str, lang: str) -> str:
-    ext = path.suffix.lower()
-    items: list[str] = []
-
-    if ext in {".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx"}:
-        items.extend(re.findall(r"^\s*import\s+.*?\s+from\s+['\"]([^'\"]+)['\"]", content, re.MULTILINE))
-        items.extend(re.findall(r"require\(\s*['\"]([^'\"]+)['\"]\s*\)", content))
-    elif ext == ".py":
-        for line in content.splitlines():
-            stripped = line.strip()
-            if stripped.startswith("import "):
-                clause = stripped[len("import ") :]
-                for token in clause.split(","):
-                    mod = token.strip().split(" as ")[0].strip()
-                    if mod:
-                        items.append(mod)
-            elif stripped.startswith("from "):
-                match = re.match(r"from\s+([A-Za-z0-9_\.]+)\s+import\s+", stripped)
-                if match:
-                    items.append(match.group(1))
-    elif ext == ".go":
-        in_block = False
-        for line in content.splitlines():
-            stripped = line.strip()
-            if stripped.startswith("import ("):
-                in_block = True
+def _split_names(clause: str) -> list[str]:
+    names = []
+    for token in clause.split(","):
+        name = token.strip().split(" as ")[0].strip()
+        if name:
+            names.append(name)
+    return names
+
+
+def _scan_ts(content: str) -> tuple[list[str], list[str]]:
+    text = "\n" + content
+    imports = _TS_IMPORT_RE.findall(text) + _TS_REQUIRE_RE.findall(content)
+    exports = _TS_EXPORT_RE.findall(text)
+    if _TS_EXPORT_DEFAULT_RE.search(text):
+        exports.append("default export")
+    for clause in _TS_EXPORT_BRACE_RE.findall(text):
+        exports.extend(_split_names(clause))
+    return imports, exports
+
+
+def _scan_py(content: str) -> tuple[list[str], list[str]]:
+    imports: list[str] = []
+    for line in content.splitlines():
+        # Both import forms need the keyword, so most lines skip the strip().
+        if "import" not in line:
+            continue
+        stripped = line.strip()
+        if stripped.startswith("import "):
+            imports.extend(_split_names(stripped[len("import ") :]))
+        elif stripped.startswith("from "):
+            match = _PY_FROM_RE.match(stripped)
+            if match:
+                imports.append(match.group(1))
+
+    exports: list[str] = []
+    all_match = _PY_ALL_RE.search(content)
+    if all_match:
+        exports.extend(_PY_ALL_ITEM_RE.findall(all_match.group(1)))
+    text = "\n" + content
+    exports.extend(_PY_DEF_RE.findall(text))
+    exports.extend(_PY_CLASS_RE.findall(text))
+    return imports, exports
+
+
+def _scan_go(content: str) -> tuple[list[str], list[str]]:
+    imports: list[str] = []
+    in_block = False
+    for line in content.splitlines():
+        if not in_block and "import" not in line:
+            continue
+        stripped = line.strip()
+        if stripped.startswith("import ("):
+            in_block = True
+            continue
+        if in_block:
+            if stripped.startswith(")"):
+                in_block = False
                 continue
-            if in_block:
-                if stripped.startswith(")"):
-                    in_block = False
-                    continue
-                hit = re.search(r"\"([^\"]+)\"", stripped)
-                if hit:
-                    items.append(hit.group(1))
-            elif stripped.startswith("import "):
-                hit = re.search(r"\"([^\"]+)\"", stripped)
-                if hit:
-                    items.append(hit.group(1))
-    elif ext == ".java":
-        items.extend(re.findall(r"^\s*import\s+([A-Za-z0-9_.*]+)\s*;", content, re.MULTILINE))
-
-    return summarize_items(items, lang)
-
-
-def infer_outputs(path: Path, content: str, lang: str) -> str:
-    ext = path.suffix.lower()
-    items: list[str] = []
-
-    if ext in {".js", ".jsx", ".mjs", ".cjs", ".ts", ".tsx"}:
-        items.extend(
-            re.findall(
-                r"^\s*export\s+(?:async\s+)?(?:function|class|const|let|var|interface|type|enum)\s+([A-Za-z_][A-Za-z0-9_]*)",
-                content,
-                re.MULTILINE,
-            )
-        )
-        if re.search(r"^\s*export\s+default\b", content, re.MULTILINE):
-            items.append("default export")
-        for clause in re.findall(r"^\s*export\s*\{([^}]*)\}", content, re.MULTILINE):
-            for token in clause.split(","):
-                name = token.strip().split(" as ")[0].strip()
-                if name:
-                    items.append(name)
-    elif ext == ".py":
-        all_match = re.search(r"__all__\s*=\s*\[(.*?)\]", content, re.DOTALL)
-        if all_match:
-            items.extend(re.findall(r"['\"]([A-Za-z0-9_]+)['\"]", all_match.group(1)))
-        items.extend(re.findall(r"^def\s+([A-Za-z_][A-Za-z0-9_]*)\s*\(", content, re.MULTILINE))
-        items.extend(re.findall(r"^class\s+([A-Za-z_][A-Za-z0-9_]*)\b", content, re.MULTILINE))
-    elif ext == ".go":
-        items.extend(re.findall(r"^\s*(?:type|var|const)\s+([A-Z][A-Za-z0-9_]*)\b", content, re.MULTILINE))
-        items.extend(re.findall(r"^\s*func\s+([A-Z][A-Za-z0-9_]*)\s*\(", content, re.MULTILINE))
-        items.extend(re.findall(r"^\s*func\s+\([^)]*\)\s+([A-Z][A-Za-z0-9_]*)\s*\(", content, re.MULTILINE))
-    elif ext == ".java":
-        items.extend(
-            re.findall(
-                r"^\s*public\s+(?:final\s+|abstract\s+)?(?:class|interface|enum|record)\s+([A-Za-z_][A-Za-z0-9_]*)\b",
-                content,
-                re.MULTILINE,
-            )
-        )
+            hit = _GO_IMPORT_PATH_RE.search(stripped)
+            if hit:
+                imports.append(hit.group(1))
+        elif stripped.startswith("import "):
+            hit = _GO_IMPORT_PATH_RE.search(stripped)
+            if hit:
+                imports.append(hit.group(1))
+
+    text = "\n" + content
+    exports = _GO_DECL_RE.findall(text) + _GO_FUNC_RE.findall(text) + _GO_METHOD_RE.findall(text)
+    return imports, exports
+
 
-    if not items:
-        items.append(path.stem)
+def _scan_java(content: str) -> tuple[list[str], list[str]]:
+    text = "\n" + content
+    return _JAVA_IMPORT_RE.findall(text), _JAVA_EXPORT_RE.findall(text)
 
-    return summarize_items(items, lang)
+
+SOURCE_SCANNERS = {
+    **dict.fromkeys(JS_EXTENSIONS, _scan_ts),
+    ".py": _scan_py,
+    ".go": _scan_go,
+    ".java": _scan_java,
+}
+
+
+def infer_inputs_outputs(path: Path, content: str, lang: str) -> tuple[str, str]:
+    scanner = SOURCE_SCANNERS.get(path.suffix.lower())
+    imports, exports = scanner(content) if scanner else ([], [])
+    if not exports:
+        exports.append(path.stem)
+    return summarize_items(imports, lang), summarize_items(exports, lang)
 
 
 def infer_position(path: Path, root: Path, lang: str) -> str:
-    role = infer_role(path)
-    rel_parent = path.parent.relative_to(root).as_posix()
+    role = infer_role(path.stem.lower())
+    rel_parent = relative_posix(path.parent, root)
     if rel_parent == ".":
         rel_parent = "root"
     if lang == "zh":
@@ -368,40 +576,15 @@ def infer_position(path: Path, root: Path, lang: str) -> str:
 
 
 def build_header(path: Path, content: str, root: Path, lang: str) -> str:
-    inputs = infer_inputs(path, content, lang)
-    outputs = infer_outputs(path, content, lang)
+    inputs, outputs = infer_inputs_outputs(path, content, lang)
     position = infer_position(path, root, lang)
     if lang == "zh":
         sync_note = "文件变更时同步更新本文件头与目录 INDEX.md。"
     else:
         sync_note = "Update this header and folder INDEX.md when this file changes."
 
-    ext = path.suffix.lower()
-    if ext == ".py":
-        return (
-            "\"\"\"\n"
-            f"@input {inputs}\n"
-            f"@output {outputs}\n"
-            f"@position {position}\n"
-            f"@doc-sync {sync_note}\n"
-            "\"\"\""
-        )
-    if ext == ".go":
-        return (
-            f"// @input {inputs}\n"
-            f"// @output {outputs}\n"
-            f"// @position {position}\n"
-            f"// @doc-sync {sync_note}"
-        )
-
-    return (
-        "/**\n"
-        f" * @input {inputs}\n"
-        f" * @output {outputs}\n"
-        f" * @position {position}\n"
-        f" * @doc-sync {sync_note}\n"
-        " */"
-    )
+    template = HEADER_TEMPLATES.get(path.suffix.lower(), JS_HEADER_TEMPLATE)
+    return template.format(inputs=inputs, outputs=outputs, position=position, sync=sync_note)
 
 
 def insert_header(path: Path, content: str, header: str) -> str:
@@ -410,7 +593,7 @@ def insert_header(path: Path, content: str, header: str) -> str:
         index = 0
         if lines and lines[0].startswith("#!"):
             index = 1
-        if index < len(lines) and re.match(r"#.*coding[:=]\s*[-\w.]+", lines[index]):
+        if index < len(lines) and _PY_CODING_RE.match(lines[index]):
             index += 1
         prefix = "".join(lines[:index])
         suffix = "".join(lines[index:])
@@ -420,30 +603,57 @@ def insert_header(path: Path, content: str, header: str) -> str:
     return f"{header}\n\n{content}"
 
 
-def write_if_changed(path: Path, new_content: str, dry_run: bool, verbose: bool) -> str:
-    old_content = ""
-    existed = path.exists()
-    if existed:
-        old_content = path.read_text(encoding="utf-8", errors="ignore")
+def apply_write(path: Path, new_content: str, dry_run: bool) -> str:
+    # Write raw bytes to bypass the text-layer buffering. Newlines are translated
+    # the same way write_text would on this platform.
+    data = new_content.encode("utf-8")
+    if os.linesep != "\n":
+        data = data.replace(b"\n", os.linesep.encode("ascii"))
+
+    try:
+        old_data: bytes | None = path.read_bytes()
+    except FileNotFoundError:
+        old_data = None
 
-    if old_content == new_content:
+    # Raw bytes settle the common case; on a mismatch, compare the way read_text
+    # would so an existing file that differs only in line endings (or bytes
+    # dropped by errors="ignore") is still left alone.
+    if old_data is not None and (old_data == data or decode_source(old_data) == new_content):
         return "unchanged"
 
+    action = "create" if old_data is None else "update"
     if dry_run:
-        action = "update" if existed else "create"
-        print(f"DRY-RUN {action}: {path}")
         return action
 
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(new_content, encoding="utf-8")
-    if verbose:
-        action = "updated" if existed else "created"
-        print(f"{action}: {path}")
-    return "update" if existed else "create"
+    # data already carries os.linesep; O_BINARY stops Windows from expanding it again.
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o666)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view) :]
+    finally:
+        os.close(fd)
+    return action
+
+
+def report_write(path: Path, action: str, dry_run: bool, verbose: bool) -> None:
+    if action == "unchanged":
+        return
+    if dry_run:
+        print(f"DRY-RUN {action}: {path}")
+    elif verbose:
+        print(f"{action}d: {path}")
+
+
+def write_if_changed(path: Path, new_content: str, dry_run: bool, verbose: bool) -> str:
+    action = apply_write(path, new_content, dry_run)
+    report_write(path, action, dry_run, verbose)
+    return action
 
 
 def build_folder_summary(folder: Path, file_count: int, root: Path, lang: str) -> str:
-    rel = folder.relative_to(root).as_posix()
+    rel = relative_posix(folder, root)
     if rel == ".":
         rel = "root"
     if lang == "zh":
@@ -458,6 +668,12 @@ def build_file_responsibility(path: Path, role: str, lang: str) -> str:
     return f"{role} component for {name} related logic."
 
 
+def render_index_row(path: Path, lang: str) -> str:
+    role = infer_role(path.stem.lower())
+    responsibility = build_file_responsibility(path, role, lang)
+    return INDEX_ROW_TEMPLATE.format(name=path.name, role=role, resp=responsibility)
+
+
 def render_index_file(
     folder: Path,
     files: list[Path],
@@ -470,7 +686,7 @@ def render_index_file(
         title = folder.name
 
     summary = build_folder_summary(folder, len(files), root, lang)
-    lines = [
+    header_lines = [
         "<!-- FORMAT-DOC: Update when files in this folder change -->",
         "",
         f"# {title}",
@@ -482,14 +698,8 @@ def render_index_file(
         "| File | Role | Responsibilities |",
         "|---|---|---|",
     ]
-
-    for file_path in files:
-        role = infer_role(file_path)
-        responsibility = build_file_responsibility(file_path, role, lang)
-        lines.append(f"| {file_path.name} | {role} | {responsibility} |")
-
-    lines.append("")
-    return "\n".join(lines)
+    rows = [render_index_row(file_path, lang) for file_path in files]
+    return "\n".join(header_lines + rows + [""])
 
 
 def build_architecture_overview(module_count: int, lang: str) -> list[str]:
@@ -506,13 +716,10 @@ def build_architecture_overview(module_count: int, lang: str) -> list[str]:
     ]
 
 
-def build_module_desc(index_path: Path, root: Path, lang: str) -> str:
-    rel = index_path.parent.relative_to(root).as_posix()
-    if rel == ".":
-        rel = "root"
+def build_module_desc(module_name: str, lang: str) -> str:
     if lang == "zh":
-        return f"{rel} 目录职责。"
-    return f"Responsibilities for {rel}."
+        return f"{module_name} 目录职责。"
+    return f"Responsibilities for {module_name}."
 
 
 def render_architecture_file(index_paths: list[Path], root: Path, lang: str) -> str:
@@ -532,42 +739,128 @@ def render_architecture_file(index_paths: list[Path], root: Path, lang: str) ->
         else:
             lines.append("- (no module folders found)")
     else:
-        for path in sorted(index_paths, key=lambda p: p.relative_to(root).as_posix()):
-            rel_link = path.relative_to(root).as_posix()
-            module_name = path.parent.relative_to(root).as_posix()
-            if module_name == ".":
-                module_name = "root"
-            desc = build_module_desc(path, root, lang)
+        rel_links = sorted(relative_posix(path, root) for path in index_paths)
+        for rel_link in rel_links:
+            module_name = rel_link.rpartition("/")[0] or "root"
+            desc = build_module_desc(module_name, lang)
             lines.append(f"- [{module_name}]({rel_link}) - {desc}")
 
     lines.append("")
     return "\n".join(lines)
 
 
+def _process_one_header(
+    task: tuple[Path, Path, str, int, bool],
+) -> tuple[str, str | None]:
+    path, root, lang, max_header_lines, dry_run = task
+    try:
+        # A header found in the head is authoritative; a miss may just mean the
+        # tags sit past the peeked bytes, so re-check against the full file.
+        if has_complete_header(_peek_head(path), max_header_lines):
+            return "unchanged", None
+        data = path.read_bytes()
+    except OSError as exc:
+        return "unchanged", f"failed to read {path}: {exc}"
+
+    if has_complete_header(data, max_header_lines):
+        return "unchanged", None
+
+    # Only files that actually need a header pay for the decode.
+    content = decode_source(data)
+
+    # Imports, exports and __all__ sit near the top; bound inference on huge
+    # (often generated) files to whole lines within the first INFERENCE_MAX_CHARS.
+    head = content
+    if len(content) > INFERENCE_MAX_CHARS:
+        cut = content.rfind("\n", 0, INFERENCE_MAX_CHARS)
+        head = content[: cut + 1] if cut >= 0 else content[:INFERENCE_MAX_CHARS]
+
+    header = build_header(path, head, root, lang)
+    new_content = insert_header(path, content, header)
+    return apply_write(path, new_content, dry_run), None
+
+
+def _start_header_pool(workers: int) -> ProcessPoolExecutor | None:
+    executor = None
+    try:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        # Workers start lazily; run a no-op so an unusable pool fails here, before
+        # any file has been processed, rather than halfway through the run.
+        executor.submit(int).result()
+    except (OSError, NotImplementedError, BrokenProcessPool) as exc:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        print(f"WARN: process pool unavailable ({exc}); adding headers serially")
+        return None
+    return executor
+
+
 def bootstrap_headers(
     source_files: list[Path],
     root: Path,
     lang: str,
     max_header_lines: int,
+    jobs: int,
     dry_run: bool,
     verbose: bool,
     stats: Stats,
-) -> None:
+    cache: dict[str, list[int]] | None = None,
+    file_stats: dict[str, list[int]] | None = None,
+) -> dict[str, list[int]]:
+    """Add missing headers; return the refreshed mtime/size cache of fully headed files."""
+    file_stats = file_stats or {}
+    new_cache: dict[str, list[int]] = {}
+    pending: list[Path] = []
     for path in source_files:
-        try:
-            content = path.read_text(encoding="utf-8", errors="ignore")
-        except OSError as exc:
-            print(f"WARN: failed to read {path}: {exc}")
+        key = relative_posix(path, root)
+        signature = file_stats.get(str(path))
+        if cache is not None and signature is not None and cache.get(key) == signature:
+            new_cache[key] = signature
+            stats.skipped_cached_headers += 1
             continue
+        pending.append(path)
 
-        if has_complete_header(content, max_header_lines):
-            continue
+    tasks = [(path, root, lang, max_header_lines, dry_run) for path in pending]
 
-        header = build_header(path, content, root, lang)
-        new_content = insert_header(path, content, header)
-        action = write_if_changed(path, new_content, dry_run, verbose)
-        if action in {"create", "update"}:
-            stats.headers_added += 1
+    def consume(results: Iterable[tuple[str, str | None]]) -> None:
+        for path, (action, warning) in zip(pending, results):
+            if warning:
+                print(f"WARN: {warning}")
+                continue
+            report_write(path, action, dry_run, verbose)
+            if action in {"create", "update"}:
+                stats.headers_added += 1
+            if dry_run:
+                continue
+            signature = file_stats.get(str(path))
+            if action != "unchanged":
+                try:
+                    info = path.stat()
+                except OSError:
+                    continue
+                signature = [info.st_mtime_ns, info.st_size]
+            if signature is not None:
+                new_cache[relative_posix(path, root)] = signature
+
+    workers = min(jobs, len(tasks))
+    if sys.platform == "win32":
+        # WaitForMultipleObjects caps Windows process pools at 61 workers.
+        workers = min(workers, 61)
+    executor = None
+    # Pool startup costs far more than a handful of files, notably under the spawn
+    # start method, so only fan out when there is enough work to pay for it.
+    if workers > 1 and len(tasks) >= PARALLEL_MIN_FILES:
+        executor = _start_header_pool(workers)
+    if executor is None:
+        consume(map(_process_one_header, tasks))
+        return new_cache
+
+    # Headers are independent per file, so fan out across processes to sidestep the
+    # GIL; results come back in input order, keeping the printed report stable.
+    chunksize = max(1, min(64, len(tasks) // (workers * 4)))
+    with executor:
+        consume(executor.map(_process_one_header, tasks, chunksize=chunksize))
+    return new_cache
 
 
 def bootstrap_indexes(
@@ -630,15 +923,17 @@ def main() -> int:
         print(f"Invalid root path: {root}")
         return 2
 
-    language = args.language
-    if language == "auto":
-        language = detect_language(root, args.architecture_file, args.index_file)
-
     extensions = normalize_extensions(args.ext)
     ignored_dirs = set(DEFAULT_IGNORED_DIRS)
     ignored_dirs.update(item.strip() for item in args.ignore_dir if item.strip())
 
-    source_files = collect_source_files(root, extensions, ignored_dirs)
+    language = args.language
+    if language == "auto":
+        language = detect_language(root, args.architecture_file, args.index_file, ignored_dirs)
+
+    use_cache = args.cache and not args.skip_headers
+    file_stats: dict[str, list[int]] | None = {} if use_cache else None
+    source_files = collect_source_files(root, extensions, ignored_dirs, file_stats)
     files_by_folder = group_files_by_folder(source_files)
 
     stats = Stats()
@@ -650,15 +945,25 @@ def main() -> int:
     )
 
     if not args.skip_headers:
-        bootstrap_headers(
+        cache_path = root / DEFAULT_CACHE_FILE
+        cache = load_header_cache(cache_path, args.max_header_lines) if use_cache else None
+        new_cache = bootstrap_headers(
             source_files,
             root,
             language,
             args.max_header_lines,
+            args.jobs,
             args.dry_run,
             args.verbose,
             stats,
+            cache,
+            file_stats,
         )
+        if use_cache and not args.dry_run:
+            try:
+                save_header_cache(cache_path, new_cache, args.max_header_lines)
+            except OSError as exc:
+                print(f"WARN: failed to write {cache_path}: {exc}")
 
     index_paths: list[Path] = []
     if not args.skip_index:
@@ -698,6 +1003,8 @@ def main() -> int:
         print(f"  skipped_existing_index={stats.skipped_existing_index}")
     if stats.skipped_existing_architecture:
         print(f"  skipped_existing_architecture={stats.skipped_existing_architecture}")
+    if stats.skipped_cached_headers:
+        print(f"  skipped_cached_headers={stats.skipped_cached_headers}")
 
     return 0
 